@@ -3,16 +3,48 @@ TOML Configuration Parser for Video Composite
 Handles loading and validating TOML configuration files
 """
 
-import tomllib
+import mmap
+import os
 from pathlib import Path
 from typing import Any, Dict, List, Optional
 
+# Prefer rtoml (Rust-backed, several times faster than stdlib tomllib) when
+# it's installed; both take a str and return the same plain dicts
+try:
+    import rtoml
+
+    _toml_loads = rtoml.loads
+except ImportError:
+    import tomllib
+
+    _toml_loads = tomllib.loads
+
 from gdrive_fetcher import GDriveFetcher
 
+# Shared across all VideoConfig instances so image detection is a hash
+# lookup against one frozenset instead of rebuilding a set per entry
+_IMAGE_EXTS = frozenset(
+    {".jpg", ".jpeg", ".png", ".gif", ".bmp", ".tiff", ".webp"}
+)
+
 
 class VideoConfig:
     """Represents configuration for a single video or image"""
 
+    # Fixed attribute set: slots skip the per-instance __dict__, which adds
+    # up for configs describing many entries
+    __slots__ = (
+        "path",
+        "heading",
+        "subheading",
+        "audio_path",
+        "frame_count_override",
+        "skip_frames",
+        "max_frames",
+        "original_url",
+        "is_image",
+    )
+
     def __init__(
         self,
         path: str,
@@ -25,35 +57,35 @@ class VideoConfig:
         is_image: Optional[bool] = None,
         original_url: Optional[str] = None,
     ):
-        self.path = Path(path)
+        # Paths are kept as plain strings: Path construction is roughly an
+        # order of magnitude slower than os.path string ops, and downstream
+        # code mostly wants str(path) anyway (see path_obj for callers that
+        # need a real Path)
+        self.path = path
         self.heading = heading
         self.subheading = subheading
-        self.audio_path = Path(audio_path) if audio_path else None
+        self.audio_path = audio_path or None
         self.frame_count_override = frame_count_override
         self.skip_frames = skip_frames
         self.max_frames = max_frames
         self.original_url = original_url  # Store original URL if it was a Drive link
         # Auto-detect if it's an image based on extension if not specified
         if is_image is None:
-            image_extensions = {
-                ".jpg",
-                ".jpeg",
-                ".png",
-                ".gif",
-                ".bmp",
-                ".tiff",
-                ".webp",
-            }
-            self.is_image = self.path.suffix.lower() in image_extensions
+            self.is_image = os.path.splitext(path)[1].lower() in _IMAGE_EXTS
         else:
             self.is_image = is_image
 
+    @property
+    def path_obj(self) -> Path:
+        """The media path as a pathlib.Path, for callers that need one"""
+        return Path(self.path)
+
     def validate(self) -> bool:
         """Validate that the video or image file exists"""
         media_type = "Image" if self.is_image else "Video"
-        if not self.path.exists():
+        if not os.path.exists(self.path):
             raise FileNotFoundError(f"{media_type} file not found: {self.path}")
-        if self.audio_path and not self.audio_path.exists():
+        if self.audio_path and not os.path.exists(self.audio_path):
             raise FileNotFoundError(f"Audio file not found: {self.audio_path}")
         return True
 
@@ -66,12 +98,31 @@ class VideoConfig:
 class CompositeConfig:
     """Main configuration for the video composite"""
 
+    __slots__ = (
+        "gdrive_fetcher",
+        "working_dir",
+        "output_path",
+        "output_fps",
+        "output_preset",
+        "output_threads",
+        "output_bitrate",
+        "output_variants",
+        "show_frame_count",
+        "heading_font_size",
+        "subheading_font_size",
+        "frame_count_font_size",
+        "text_color",
+        "text_bg_color",
+        "text_bg_opacity",
+        "_video_entries",
+        "_videos",
+    )
+
     def __init__(
         self,
         config_dict: Dict[str, Any],
         gdrive_fetcher: Optional[GDriveFetcher] = None,
     ):
-        self.videos: List[VideoConfig] = []
         self.gdrive_fetcher = gdrive_fetcher
         output_config = config_dict.get("output", {})
         self.working_dir = output_config.get("working_dir", "")
@@ -89,6 +140,25 @@ class CompositeConfig:
         self.output_preset = output_config.get("preset", "ultrafast")
         self.output_threads = output_config.get("threads", 4)
         self.output_bitrate = output_config.get("bitrate", "15000k")
+
+        # Optional extra output variants (e.g. a low-bitrate preview) that
+        # are encoded alongside the main output from the same decode/filter
+        # pass; unset fields fall back to the main output settings
+        self.output_variants = []
+        for variant in output_config.get("variants", []):
+            variant_path = variant.get("path", "")
+            if not variant_path:
+                continue
+            if self.working_dir and not Path(variant_path).is_absolute():
+                variant_path = str(Path(self.working_dir) / variant_path)
+            self.output_variants.append(
+                {
+                    "path": variant_path,
+                    "preset": variant.get("preset", self.output_preset),
+                    "bitrate": variant.get("bitrate", self.output_bitrate),
+                }
+            )
+
         self.show_frame_count = output_config.get("show_frame_count", True)
 
         # Text styling
@@ -100,111 +170,153 @@ class CompositeConfig:
         self.text_bg_color = tuple(text_config.get("bg_color", [0, 0, 0]))
         self.text_bg_opacity = text_config.get("bg_opacity", 0.7)
 
-        # Parse videos
-        videos_list = config_dict.get("videos", [])
-        for video_data in videos_list:
-            video_path = video_data.get("path", "")
-            original_url = None
-
-            # Check if it's a Google Drive link and fetch it
-            if self.gdrive_fetcher and self.gdrive_fetcher.is_gdrive_link(video_path):
-                print(f"Detected Google Drive link: {video_path}")
-                original_url = video_path
-                fetched_path = self.gdrive_fetcher.fetch(video_path)
-                if fetched_path:
-                    video_path = str(fetched_path)
-                else:
-                    raise ValueError(f"Failed to fetch Google Drive file: {video_path}")
-            # Prepend working_dir if set and path is not absolute
-            elif self.working_dir and not Path(video_path).is_absolute():
-                video_path = str(Path(self.working_dir) / video_path)
-
-            audio_path = video_data.get("audio_path", "")
-            if audio_path:
-                # Check if audio is a Google Drive link
-                if self.gdrive_fetcher and self.gdrive_fetcher.is_gdrive_link(
-                    audio_path
-                ):
-                    print(f"Detected Google Drive link for audio: {audio_path}")
-                    fetched_audio = self.gdrive_fetcher.fetch(audio_path)
-                    if fetched_audio:
-                        audio_path = str(fetched_audio)
-                    else:
-                        raise ValueError(
-                            f"Failed to fetch Google Drive audio: {audio_path}"
-                        )
-                elif self.working_dir and not Path(audio_path).is_absolute():
-                    audio_path = str(Path(self.working_dir) / audio_path)
-
-            video = VideoConfig(
-                path=video_path,
-                heading=video_data.get("heading", ""),
-                subheading=video_data.get("subheading", ""),
-                audio_path=audio_path,
-                is_image=video_data.get("is_image", None),
-                frame_count_override=video_data.get("frame_count_override", None),
-                skip_frames=video_data.get("skip_frames", 0),
-                max_frames=video_data.get("max_frames", None),
-                original_url=original_url,
-            )
-            self.videos.append(video)
-
-        # Parse images (they get added as additional videos in the grid)
-        images_list = config_dict.get("image", [])
-        for image_data in images_list:
-            image_path = image_data.get("path", "")
-            original_url = None
-
-            # Check if it's a Google Drive link and fetch it
-            if self.gdrive_fetcher and self.gdrive_fetcher.is_gdrive_link(image_path):
-                print(f"Detected Google Drive link: {image_path}")
-                original_url = image_path
-                fetched_path = self.gdrive_fetcher.fetch(image_path)
-                if fetched_path:
-                    image_path = str(fetched_path)
-                else:
-                    raise ValueError(f"Failed to fetch Google Drive file: {image_path}")
-            # Prepend working_dir if set and path is not absolute
-            elif self.working_dir and not Path(image_path).is_absolute():
-                image_path = str(Path(self.working_dir) / image_path)
-
-            audio_path = image_data.get("audio_path", "")
-            if audio_path:
-                # Check if audio is a Google Drive link
-                if self.gdrive_fetcher and self.gdrive_fetcher.is_gdrive_link(
-                    audio_path
-                ):
-                    print(f"Detected Google Drive link for audio: {audio_path}")
-                    fetched_audio = self.gdrive_fetcher.fetch(audio_path)
-                    if fetched_audio:
-                        audio_path = str(fetched_audio)
-                    else:
-                        raise ValueError(
-                            f"Failed to fetch Google Drive audio: {audio_path}"
-                        )
-                elif self.working_dir and not Path(audio_path).is_absolute():
-                    audio_path = str(Path(self.working_dir) / audio_path)
-
-            image = VideoConfig(
-                path=image_path,
-                heading=image_data.get("heading", ""),
-                subheading=image_data.get("subheading", ""),
-                audio_path=audio_path,
-                is_image=True,  # Force as image
-                frame_count_override=image_data.get("frame_count_override", None),
-                skip_frames=image_data.get("skip_frames", 0),
-                max_frames=image_data.get("max_frames", None),
-                original_url=original_url,
-            )
-            self.videos.append(image)
+        # Keep the raw [[videos]]/[[image]] tables and build VideoConfig
+        # objects lazily: Drive fetches and Path handling only happen when
+        # self.videos is first accessed (e.g. by validate())
+        self._video_entries: List[tuple] = [
+            (video_data, False) for video_data in config_dict.get("videos", [])
+        ] + [
+            # Images get added as additional videos in the grid, forced as images
+            (image_data, True)
+            for image_data in config_dict.get("image", [])
+        ]
+        self._videos: Optional[List[VideoConfig]] = None
+
+    @property
+    def videos(self) -> List[VideoConfig]:
+        """Video/image entries, materialized on first access"""
+        if self._videos is None:
+            # Prefetch all distinct Drive links concurrently up front; the
+            # per-entry fetch in _build_video then hits the warm cache (or
+            # the in-flight lock) instead of downloading one at a time
+            if self.gdrive_fetcher:
+                drive_urls = []
+                for entry_data, _force_image in self._video_entries:
+                    for url in (
+                        entry_data.get("path", ""),
+                        entry_data.get("audio_path", ""),
+                    ):
+                        if (
+                            url
+                            and self.gdrive_fetcher.is_gdrive_link(url)
+                            and url not in drive_urls
+                        ):
+                            drive_urls.append(url)
+                if len(drive_urls) > 1:
+                    self.gdrive_fetcher.fetch_many(drive_urls)
+
+            # Entries that are byte-for-byte identical share one VideoConfig,
+            # so duplicated clips are resolved and validated only once
+            seen: Dict[tuple, VideoConfig] = {}
+            videos: List[VideoConfig] = []
+            for entry_data, force_image in self._video_entries:
+                key = (
+                    entry_data.get("path", ""),
+                    entry_data.get("audio_path", ""),
+                    entry_data.get("heading", ""),
+                    entry_data.get("subheading", ""),
+                    force_image,
+                    entry_data.get("is_image"),
+                    entry_data.get("frame_count_override"),
+                    entry_data.get("skip_frames", 0),
+                    entry_data.get("max_frames"),
+                )
+                video = seen.get(key)
+                if video is None:
+                    video = self._build_video(entry_data, force_image)
+                    seen[key] = video
+                videos.append(video)
+            self._videos = videos
+        return self._videos
+
+    def _resolve_media_path(self, path: str, label: str = "file"):
+        """
+        Resolve a configured path: fetch Google Drive links, prepend
+        working_dir to relative local paths
+
+        Returns:
+            Tuple of (resolved path, original URL if it was a Drive link)
+        """
+        original_url = None
+
+        if self.gdrive_fetcher and self.gdrive_fetcher.is_gdrive_link(path):
+            suffix = f" for {label}" if label != "file" else ""
+            print(f"Detected Google Drive link{suffix}: {path}")
+            original_url = path
+            fetched_path = self.gdrive_fetcher.fetch(path)
+            if fetched_path:
+                path = str(fetched_path)
+            else:
+                raise ValueError(f"Failed to fetch Google Drive {label}: {path}")
+        # Prepend working_dir if set and path is not absolute
+        elif self.working_dir and not Path(path).is_absolute():
+            path = str(Path(self.working_dir) / path)
+
+        return path, original_url
+
+    def _build_video(self, entry_data: Dict[str, Any], force_image: bool) -> VideoConfig:
+        """Build a VideoConfig from a raw [[videos]]/[[image]] table"""
+        video_path, original_url = self._resolve_media_path(entry_data.get("path", ""))
+
+        audio_path = entry_data.get("audio_path", "")
+        if audio_path:
+            audio_path, _ = self._resolve_media_path(audio_path, label="audio")
+
+        return VideoConfig(
+            path=video_path,
+            heading=entry_data.get("heading", ""),
+            subheading=entry_data.get("subheading", ""),
+            audio_path=audio_path,
+            is_image=True if force_image else entry_data.get("is_image", None),
+            frame_count_override=entry_data.get("frame_count_override", None),
+            skip_frames=entry_data.get("skip_frames", 0),
+            max_frames=entry_data.get("max_frames", None),
+            original_url=original_url,
+        )
 
     def validate(self) -> bool:
         """Validate all video and overlay configurations"""
         if not self.videos:
             raise ValueError("No videos specified in configuration")
 
+        # Batch existence checks: one scandir() per distinct parent directory
+        # instead of a stat() per file. Most configs point all their media at
+        # one or two directories, so this is O(directories) syscalls.
+        by_dir: Dict[str, Optional[set]] = {}
+        for video in self.videos:
+            paths = [video.path]
+            if video.audio_path:
+                paths.append(video.audio_path)
+            for path in paths:
+                parent = os.path.dirname(path) or "."
+                if parent not in by_dir:
+                    try:
+                        # Skip dangling symlinks: their names are listed but
+                        # the media isn't there, and they must fail per-file
+                        # validation below rather than pass the batch check
+                        by_dir[parent] = {
+                            e.name
+                            for e in os.scandir(parent)
+                            if not (e.is_symlink() and not os.path.exists(e.path))
+                        }
+                    except OSError:
+                        # Parent missing/unreadable; per-file validate below
+                        # raises the usual FileNotFoundError
+                        by_dir[parent] = None
+
         for video in self.videos:
-            video.validate()
+            media_names = by_dir.get(os.path.dirname(video.path) or ".")
+            if media_names is None or os.path.basename(video.path) not in media_names:
+                # Fall back to the single-file check for the exact error
+                video.validate()
+                continue
+            if video.audio_path:
+                audio_names = by_dir.get(os.path.dirname(video.audio_path) or ".")
+                if (
+                    audio_names is None
+                    or os.path.basename(video.audio_path) not in audio_names
+                ):
+                    video.validate()
 
         return True
 
@@ -234,12 +346,29 @@ def load_config(
     """
     config_file = Path(config_path)
 
-    if not config_file.exists():
-        raise FileNotFoundError(f"Configuration file not found: {config_path}")
-
-    # Load TOML file
-    with open(config_file, "rb") as f:
-        config_dict = tomllib.load(f)
+    # Load TOML file via mmap so parsing reads straight from the page cache
+    # instead of going through buffered read() calls. Opening directly (EAFP)
+    # avoids a separate exists() stat and the race between check and open.
+    try:
+        fd = os.open(config_file, os.O_RDONLY)
+    except FileNotFoundError as e:
+        raise FileNotFoundError(
+            f"Configuration file not found: {config_path}"
+        ) from e
+    try:
+        size = os.fstat(fd).st_size
+        if size == 0:
+            config_dict = _toml_loads("")
+        else:
+            mm = mmap.mmap(fd, size, access=mmap.ACCESS_READ)
+            try:
+                # Decode straight from the mapping: str() accepts the buffer
+                # protocol, so no intermediate bytes copy is made
+                config_dict = _toml_loads(str(memoryview(mm), "utf-8"))
+            finally:
+                mm.close()
+    finally:
+        os.close(fd)
 
     # Initialize Google Drive fetcher
     gdrive_fetcher = GDriveFetcher(cache_dir=cache_dir, cache_duration=cache_duration)
@@ -270,6 +399,12 @@ bitrate = "5000k"  # Video bitrate (e.g., "5000k", "10000k" for higher quality)
 show_frame_count = true  # Show frame count in analysis output (default: true)
 # working_dir = "vid2"  # Optional: Prepend this directory to all relative paths (videos, images, audio)
 
+# Optional: Extra output variants encoded in the same pass (decode/filter are shared)
+# [[output.variants]]
+# path = "output_preview.mp4"
+# preset = "ultrafast"  # Defaults to the main preset
+# bitrate = "2000k"  # Defaults to the main bitrate
+
 # Text styling
 [text]
 heading_font_size = 60
@@ -3,18 +3,131 @@ FFmpeg Video Composite Script
 Uses ffmpeg-python library for clean, fast video processing
 """
 
+import functools
+import hashlib
+import json
+import os
+import shutil
+import subprocess
 import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
-import ffmpeg
+# ffmpeg-python, Pillow and config_parser (whose import chain pulls in
+# requests) are imported lazily inside the functions that need them:
+# importing this module stays cheap, and a run only pays for the pieces
+# it actually reaches (main() always needs config_parser, but ffmpeg and
+# Pillow load only once probing/rendering starts)
+
+# Common system font locations, first match wins (see find_system_font)
+FONT_CANDIDATES = [
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf",
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+    "/usr/share/fonts/truetype/liberation/LiberationSans-Bold.ttf",
+    "/usr/share/fonts/TTF/DejaVuSans-Bold.ttf",
+    "/System/Library/Fonts/Helvetica.ttc",
+    "C:\\Windows\\Fonts\\arialbd.ttf",
+    "C:\\Windows\\Fonts\\arial.ttf",
+]
+
+# Probe results are cached here keyed by (path, mtime, size), so re-running
+# a composite or iterating on text settings skips ffprobe entirely
+_PROBE_CACHE_DIR = Path.home() / ".cache" / "mh-video-combiner" / "probe"
+
+# Inputs on remote/object storage get capped probe reads (see get_video_info)
+_REMOTE_PREFIXES = ("http://", "https://", "s3://")
+
+
+def _probe_cache_file(video_path: str):
+    """Cache file for a video's probe result, or None if it can't be keyed"""
+    try:
+        st = os.stat(video_path)
+    except OSError:
+        return None
+    key = hashlib.sha1(
+        f"{os.path.abspath(video_path)}|{st.st_mtime_ns}|{st.st_size}".encode()
+    ).hexdigest()
+    return _PROBE_CACHE_DIR / f"{key}.json"
+
+
+def _probe_with_pyav(video_path: str):
+    """
+    Read video metadata in-process with PyAV
+
+    Returns:
+        Info dict, or None if the file can't be read this way (caller falls
+        back to ffprobe)
+    """
+    # PyAV reads container metadata in-process via libavformat, skipping
+    # the ffprobe subprocess spawn entirely; optional dependency
+    try:
+        import av
+    except ImportError:
+        return None
+
+    try:
+        with av.open(video_path) as container:
+            if not container.streams.video:
+                return None
+            video_stream = container.streams.video[0]
+
+            fps = float(video_stream.average_rate or 30)
+
+            if video_stream.duration is not None:
+                duration = float(video_stream.duration * video_stream.time_base)
+            elif container.duration is not None:
+                duration = container.duration / av.time_base
+            else:
+                duration = 0.0
 
-from config_parser import create_example_config, load_config
+            frame_count = video_stream.frames or int(duration * fps)
+
+            return {
+                "width": video_stream.codec_context.width,
+                "height": video_stream.codec_context.height,
+                "fps": fps,
+                "duration": duration,
+                "frame_count": frame_count,
+            }
+    except Exception:
+        return None
 
 
 def get_video_info(video_path: str) -> dict:
-    """Get video information using ffmpeg.probe"""
+    """Get video information using PyAV when installed, else ffmpeg.probe"""
+    cache_file = _probe_cache_file(video_path)
+    if cache_file is not None:
+        try:
+            return json.loads(cache_file.read_text())
+        except (OSError, json.JSONDecodeError):
+            pass
+
+    info = _probe_with_pyav(video_path)
+    if info is not None:
+        _write_probe_cache(cache_file, info)
+        return info
+
+    import ffmpeg
+
     try:
-        probe = ffmpeg.probe(str(video_path))
+        # Only request the fields we use; in particular this keeps ffprobe
+        # from computing anything that needs a full packet walk
+        probe_kwargs = {
+            "v": "error",
+            "show_entries": (
+                "format=duration:"
+                "stream=codec_type,width,height,r_frame_rate,nb_frames,duration"
+            ),
+        }
+        if str(video_path).startswith(_REMOTE_PREFIXES):
+            # Cap how much libavformat reads while probing so a faststart
+            # file on remote/object storage costs roughly its moov atom
+            # instead of large media byte ranges
+            probe_kwargs.update(
+                probesize="1M", analyzeduration="1M", fflags="+fastseek"
+            )
+        probe = ffmpeg.probe(str(video_path), **probe_kwargs)
     except ffmpeg.Error as e:
         raise RuntimeError(f"Failed to probe {video_path}: {e.stderr.decode()}")
     except FileNotFoundError:
@@ -34,10 +147,15 @@ def get_video_info(video_path: str) -> dict:
     num, den = map(int, fps_str.split("/"))
     fps = num / den if den != 0 else 30
 
-    # Get duration
-    duration = float(
-        video_stream.get("duration") or probe.get("format", {}).get("duration", 0)
-    )
+    # Get duration: the container header is checked first since stream-level
+    # duration is absent in some containers (e.g. TS), where asking ffprobe
+    # for it forces a slow packet scan
+    duration_str = probe.get("format", {}).get("duration")
+    duration_source = "container"
+    if not duration_str:
+        duration_str = video_stream.get("duration")
+        duration_source = "stream"
+    duration = float(duration_str or 0)
 
     # Calculate frame count
     # Try to get from nb_frames first (most accurate if available)
@@ -48,14 +166,273 @@ def get_video_info(video_path: str) -> dict:
         # Calculate from duration and fps
         frame_count = int(duration * fps)
 
-    return {
+    info = {
         "width": int(video_stream["width"]),
         "height": int(video_stream["height"]),
         "fps": fps,
         "duration": duration,
         "frame_count": frame_count,
+        # Recorded for debugging (visible in the probe cache files)
+        "duration_source": duration_source,
     }
 
+    _write_probe_cache(cache_file, info)
+    return info
+
+
+def _write_probe_cache(cache_file, info: dict):
+    """Persist a probe result; best-effort, failures are ignored"""
+    if cache_file is None:
+        return
+    try:
+        _PROBE_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        cache_file.write_text(json.dumps(info))
+    except OSError:
+        pass
+
+
+def _select_h264_encoder() -> str:
+    """
+    Pick the best available H.264 encoder, preferring hardware
+
+    Hardware encoders (NVENC/QuickSync/VideoToolbox) offload encoding to
+    dedicated silicon and are typically several times faster than libx264.
+    VAAPI is deliberately not probed: it needs a device node and an
+    hwupload pipeline, which this CPU-side filter graph doesn't build.
+
+    Listing in `ffmpeg -encoders` only proves an encoder was compiled in —
+    stock distro builds list h264_nvenc on machines with no NVIDIA GPU —
+    so each candidate is validated with a one-frame null encode before
+    it's selected.
+    """
+    try:
+        result = subprocess.run(
+            ["ffmpeg", "-hide_banner", "-encoders"],
+            capture_output=True,
+            text=True,
+        )
+    except OSError:
+        return "libx264"
+
+    for encoder in ("h264_nvenc", "h264_qsv", "h264_videotoolbox"):
+        if encoder not in result.stdout:
+            continue
+        check = subprocess.run(
+            [
+                "ffmpeg", "-hide_banner", "-v", "error",
+                "-f", "lavfi", "-i", "color=s=64x64:d=0.1",
+                "-frames:v", "1", "-c:v", encoder, "-f", "null", "-",
+            ],
+            capture_output=True,
+        )
+        if check.returncode == 0:
+            return encoder
+    return "libx264"
+
+
+@functools.lru_cache(maxsize=1)
+def find_system_font():
+    """Find a usable TrueType font on this system (result cached: fonts
+    don't move mid-run, so the candidate list is only stat'd once)"""
+    for font_path in FONT_CANDIDATES:
+        if os.path.isfile(font_path):
+            return font_path
+    return None
+
+
+@functools.lru_cache(maxsize=8)
+def _load_font(size: int):
+    """Load the system font at the given size, falling back to PIL's default"""
+    from PIL import ImageFont
+
+    font_path = find_system_font()
+    if font_path:
+        try:
+            return ImageFont.truetype(font_path, size)
+        except OSError:
+            pass
+    return ImageFont.load_default(size)
+
+
+def _overlay_layout(config):
+    """
+    Text box geometry derived from the configured font sizes
+
+    Returns:
+        Tuple of (spacing_between, vertical_padding, top_padding, box_height)
+    """
+    spacing_between = int(config.heading_font_size * 0.5)
+    vertical_padding = int(config.heading_font_size * 0.6)
+    top_padding = int(config.heading_font_size * 0.3)
+    box_height = (
+        config.heading_font_size
+        + spacing_between
+        + config.subheading_font_size
+        + vertical_padding
+    )
+    return spacing_between, vertical_padding, top_padding, box_height
+
+
+def _draw_clip_overlay(
+    draw, video_config, x_offset, frame_width, frame_height, config, frame_count,
+    layout,
+):
+    """
+    Draw one clip's text overlay (label box, heading/subheading, frame count)
+    onto the shared composite canvas at its horizontal offset
+
+    Returns:
+        True if anything was drawn for this clip
+    """
+    drew = False
+    _spacing_between, vertical_padding, top_padding, box_height = layout
+    box_fill = (0, 0, 0, int(config.text_bg_opacity * 255))
+
+    if video_config.heading or video_config.subheading:
+        drew = True
+        draw.rectangle(
+            [
+                x_offset,
+                frame_height - box_height,
+                x_offset + frame_width,
+                frame_height,
+            ],
+            fill=box_fill,
+        )
+
+        if video_config.heading:
+            draw.text(
+                (x_offset + frame_width / 2, frame_height - box_height + top_padding),
+                video_config.heading,
+                font=_load_font(config.heading_font_size),
+                fill=config.text_color,
+                anchor="ma",
+            )
+
+        if video_config.subheading:
+            draw.text(
+                (
+                    x_offset + frame_width / 2,
+                    frame_height - vertical_padding - config.subheading_font_size,
+                ),
+                video_config.subheading,
+                font=_load_font(config.subheading_font_size),
+                fill=config.text_color,
+                anchor="ma",
+            )
+
+    if config.show_frame_count:
+        drew = True
+        frame_count_padding = 10
+        box_width = int(config.frame_count_font_size * 4)  # Approximate width
+        box_height = int(config.frame_count_font_size * 1.5)
+        draw.rectangle(
+            [x_offset, 0, x_offset + box_width, box_height], fill=box_fill
+        )
+        draw.text(
+            (x_offset + frame_count_padding, frame_count_padding),
+            f"Frames: {frame_count}",
+            font=_load_font(config.frame_count_font_size),
+            fill=config.text_color,
+        )
+
+    return drew
+
+
+def render_overlay_png(clips, total_width, total_height, config, output_path):
+    """
+    Render the text overlays for every clip into one transparent RGBA PNG
+    spanning the full composite
+
+    Each entry in clips is (video_config, x_offset, frame_width, frame_height,
+    frame_count). Compositing a single pre-rendered layer once, after hstack,
+    is far cheaper than drawbox/drawtext — which re-fill the box and
+    re-rasterize every glyph with freetype on every single frame — and costs
+    one overlay filter instead of one per clip.
+
+    Returns:
+        output_path if anything was drawn, None if no clip needs an overlay
+    """
+    from PIL import Image, ImageDraw
+
+    img = Image.new("RGBA", (total_width, total_height), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(img)
+
+    # Dynamic spacing based on font size (same rules as the config docs)
+    layout = _overlay_layout(config)
+
+    drew = False
+    for video_config, x_offset, frame_width, frame_height, frame_count in clips:
+        drew |= _draw_clip_overlay(
+            draw,
+            video_config,
+            x_offset,
+            frame_width,
+            frame_height,
+            config,
+            frame_count,
+            layout,
+        )
+
+    if not drew:
+        return None
+    img.save(output_path)
+    return output_path
+
+
+def compile_command(inputs, filter_complex, audio_map, output_fps, encoder, config):
+    """
+    Assemble the full ffmpeg command as a flat argument list: inputs (with
+    their trim options), the fused filter graph, stream maps and encoder
+    settings. Pure function of its arguments — building the command is kept
+    separate from running it so it can be inspected or logged.
+    """
+    # The main output plus any configured variants (e.g. a low-bitrate
+    # preview) are encoded in the same ffmpeg run, so decode and filtering
+    # are shared across all of them; each output gets its own encoder
+    # settings, which the tee muxer could not express
+    outputs = [
+        {
+            "path": str(config.output_path),
+            "preset": config.output_preset,
+            "bitrate": config.output_bitrate,
+        }
+    ] + list(getattr(config, "output_variants", None) or [])
+
+    cmd = ["ffmpeg", "-y"]
+    for path, input_opts in inputs:
+        if "ss" in input_opts:
+            cmd += ["-ss", str(input_opts["ss"])]
+        if "t" in input_opts:
+            cmd += ["-t", str(input_opts["t"])]
+        cmd += ["-i", path]
+
+    if len(outputs) > 1:
+        # Fan the stacked stream out so each output encodes its own tap
+        out_labels = [f"[vout{j}]" for j in range(len(outputs))]
+        filter_complex += f";[vout]split={len(outputs)}{''.join(out_labels)}"
+    else:
+        out_labels = ["[vout]"]
+    cmd += ["-filter_complex", filter_complex]
+
+    for out_label, output in zip(out_labels, outputs):
+        cmd += ["-map", out_label]
+        if audio_map is not None:
+            cmd += ["-map", audio_map, "-c:a", "aac", "-b:a", "192k"]
+        cmd += ["-r", str(output_fps), "-c:v", encoder]
+        if encoder == "libx264":
+            # x264 speed presets (ultrafast..veryslow) don't apply to the
+            # hardware encoders, which use their own preset vocabularies
+            cmd += ["-preset", output["preset"]]
+        cmd += [
+            "-b:v",
+            output["bitrate"],
+            "-threads",
+            str(config.output_threads),
+            output["path"],
+        ]
+    return cmd
+
 
 def create_composite_video(config):
     """
@@ -71,10 +448,16 @@ def create_composite_video(config):
     # Step 1: Analyze all videos
     print(f"\nAnalyzing {len(config.videos)} video(s)...")
 
+    # Probe all inputs in parallel: each probe is an ffprobe subprocess wait,
+    # so total latency is roughly the slowest probe instead of the sum
+    with ThreadPoolExecutor(max_workers=min(32, len(config.videos))) as executor:
+        probed_infos = list(
+            executor.map(lambda vc: get_video_info(str(vc.path)), config.videos)
+        )
+
     video_infos = []
-    for idx, video_config in enumerate(config.videos):
+    for idx, (video_config, info) in enumerate(zip(config.videos, probed_infos)):
         print(f"  [{idx + 1}] Loading: {video_config.path}")
-        info = get_video_info(str(video_config.path))
 
         # Calculate effective frame count based on skip_frames and max_frames
         original_frame_count = info["frame_count"]
@@ -170,271 +553,258 @@ def create_composite_video(config):
     # Step 2: Build ffmpeg filter chain
     print("\nBuilding filter chain...")
 
-    # Create input streams and apply trimming at input level
-    input_streams = []
-    for video_config, info in zip(config.videos, video_infos):
-        # Apply skip_frames and max_frames using ss and t input options
-        # This is done at the input level before demuxing, which is more efficient
-        # and keeps audio/video in sync
-        input_kwargs = {}
-
-        if video_config.skip_frames > 0 or video_config.max_frames is not None:
-            fps = info["fps"]
-
-            # Calculate start time from skip_frames
-            if video_config.skip_frames > 0:
-                start_time = video_config.skip_frames / fps
-                input_kwargs["ss"] = start_time
-
-            # Calculate duration if max_frames is specified
-            if video_config.max_frames is not None:
-                duration = video_config.max_frames / fps
-                input_kwargs["t"] = duration
-
-        input_streams.append(ffmpeg.input(str(video_config.path), **input_kwargs))
-
-    # Process each video stream
-    processed_streams = []
-    for i, (stream, video_config, info) in enumerate(
-        zip(input_streams, config.videos, video_infos)
-    ):
-        # Get video stream
-        v = stream.video
-
-        # Scale to target height, constrained by max width per video
-        # Calculate width to maintain aspect ratio at target_height
-        original_aspect = info["width"] / info["height"]
-        new_width = int(target_height * original_aspect)
-
-        # Constrain width to max_width_per_video to avoid excessively wide output
-        if new_width > max_width_per_video:
-            new_width = max_width_per_video
-            # Recalculate height based on constrained width
-            constrained_height = int(new_width / original_aspect)
-
-            # Ensure even dimensions for encoding stability
-            if new_width % 2 == 1:
-                new_width -= 1
-            if constrained_height % 2 == 1:
-                constrained_height -= 1
-
-            # Clamp pad height so it is never smaller than the input
-            pad_height = max(target_height, constrained_height)
-            vertical_padding = max(0, (pad_height - constrained_height) // 2)
-
-            # Use letterboxing to maintain original aspect in target_height space
-            v = v.filter("scale", new_width, constrained_height)
-            v = v.filter("pad", w=new_width, h=pad_height, x=0, y=vertical_padding)
-        else:
-            # Width is fine, just scale to target_height
-            if new_width % 2 == 1:
-                new_width -= 1
-            v = v.filter("scale", new_width, target_height)
-
-        # Pad video to max duration if needed
-        if info["duration"] < max_duration:
-            pad_duration = max_duration - info["duration"]
-            v = v.filter("tpad", stop_mode="clone", stop_duration=pad_duration)
-
-        # Calculate dynamic spacing based on font size
-        spacing_between = int(config.heading_font_size * 0.5)
-        vertical_padding = int(config.heading_font_size * 0.6)
-        top_padding = int(config.heading_font_size * 0.3)
-
-        # Add semi-transparent background box for text
-        if video_config.heading or video_config.subheading:
-            box_height = (
-                config.heading_font_size
-                + spacing_between
-                + config.subheading_font_size
-                + vertical_padding
-            )
-
-            v = v.filter(
-                "drawbox",
-                x=0,
-                y=f"h-{box_height}",
-                color=f"black@{config.text_bg_opacity}",
-                width="iw",
-                height=box_height,
-                t="fill",
-            )
-
-        # Add heading text
-        if video_config.heading:
-            box_height = (
-                config.heading_font_size
-                + spacing_between
-                + config.subheading_font_size
-                + vertical_padding
-            )
+    # Everything from here shares the temp overlay dir; the finally at the
+    # end of this function removes it on success and on every error path
+    overlay_dir = Path(tempfile.mkdtemp(prefix="mh_overlays_"))
+    try:
+        # Input list: one (path, input options) pair per video, with overlay PNGs
+        # and any explicit audio file appended after. Trimming is applied as
+        # ss/t input options, before demuxing, which is more efficient and keeps
+        # audio/video in sync.
+        # Inputs are deduplicated on (path, trim options): when the same clip
+        # appears several times (e.g. side-by-side with different captions),
+        # ffmpeg opens and decodes it once and a split filter fans the frames
+        # out to each branch.
+        inputs = []
+        input_index_by_key = {}
+        video_input_indices = []
+        consumers_per_input = {}
+        for video_config, info in zip(config.videos, video_infos):
+            input_opts = {}
+
+            if video_config.skip_frames > 0 or video_config.max_frames is not None:
+                fps = info["fps"]
+
+                # Calculate start time from skip_frames
+                if video_config.skip_frames > 0:
+                    input_opts["ss"] = video_config.skip_frames / fps
+
+                # Calculate duration if max_frames is specified
+                if video_config.max_frames is not None:
+                    input_opts["t"] = video_config.max_frames / fps
+
+            key = (str(video_config.path), input_opts.get("ss"), input_opts.get("t"))
+            input_index = input_index_by_key.get(key)
+            if input_index is None:
+                input_index = len(inputs)
+                inputs.append((str(video_config.path), input_opts))
+                input_index_by_key[key] = input_index
+            video_input_indices.append(input_index)
+            consumers_per_input[input_index] = consumers_per_input.get(input_index, 0) + 1
+
+        # Build one fused filter_complex string: each input gets a single
+        # scale[,pad][,tpad] chain, everything is hstacked, and the text layer
+        # is composited on top of the stack in one overlay. One compact graph
+        # avoids the node-per-filter copies and format negotiations that
+        # stacking individual filter objects produces.
+        filter_parts = []
+        video_labels = []
+        overlay_clips = []
+        x_offset = 0
+
+        # Fan shared decoders out with split so each consumer gets its own tap
+        splits_taken = {}
+        for input_index, consumer_count in consumers_per_input.items():
+            if consumer_count > 1:
+                split_outputs = "".join(
+                    f"[src{input_index}_{j}]" for j in range(consumer_count)
+                )
+                filter_parts.append(
+                    f"[{input_index}:v]split={consumer_count}{split_outputs}"
+                )
+                splits_taken[input_index] = 0
+
+        for i, (video_config, info) in enumerate(zip(config.videos, video_infos)):
+            # Scale to target height, constrained by max width per video.
+            # Widths and heights are computed in integer math and masked to even
+            # values up front, so every scale gets explicit literal dimensions
+            # and hstack never triggers an autoinserted rescale.
+            new_width = (info["width"] * target_height // info["height"]) & ~1
+
+            chain = []
+
+            # Constrain width to max_width_per_video to avoid excessively wide output
+            if new_width > max_width_per_video:
+                new_width = max_width_per_video & ~1
+                # Recalculate height based on constrained width
+                constrained_height = (
+                    info["height"] * new_width // info["width"]
+                ) & ~1
+
+                # Clamp pad height so it is never smaller than the input
+                pad_height = max(target_height, constrained_height)
+                vertical_padding = max(0, (pad_height - constrained_height) // 2)
+
+                # Use letterboxing to maintain original aspect in target_height space
+                chain.append(f"scale={new_width}:{constrained_height}")
+                chain.append(
+                    f"pad=w={new_width}:h={pad_height}:x=0:y={vertical_padding}"
+                )
+                frame_width, frame_height = new_width, pad_height
+            else:
+                chain.append(f"scale={new_width}:{target_height}")
+                frame_width, frame_height = new_width, target_height
 
-            heading_text = video_config.heading.replace(":", r"\:").replace(
-                "'", r"'\''"
-            )
-            v = v.filter(
-                "drawtext",
-                text=heading_text,
-                fontsize=config.heading_font_size,
-                fontcolor=config.text_color,
-                x="(w-text_w)/2",
-                y=f"h-{box_height}+{top_padding}",
-            )
+            # Pin square pixels so sample-aspect mismatches between sources
+            # can't force a resample at the hstack boundary
+            chain.append("setsar=1")
 
-        # Add subheading text
-        if video_config.subheading:
-            subheading_text = video_config.subheading.replace(":", r"\:").replace(
-                "'", r"'\''"
-            )
-            subheading_y = max_height - vertical_padding - config.subheading_font_size
-            v = v.filter(
-                "drawtext",
-                text=subheading_text,
-                fontsize=config.subheading_font_size,
-                fontcolor=config.text_color,
-                x="(w-text_w)/2",
-                y=subheading_y,
-            )
+            # Pad video to max duration if needed
+            if info["duration"] < max_duration:
+                pad_duration = max_duration - info["duration"]
+                chain.append(f"tpad=stop_mode=clone:stop_duration={pad_duration}")
 
-        # Add frame count overlay in top-left corner
-        if config.show_frame_count:
             # Get frame count (use override if provided)
             if video_config.frame_count_override is not None:
                 frame_count = video_config.frame_count_override
             else:
                 frame_count = info["frame_count"]
 
-            # Calculate box dimensions for frame count
-            frame_count_padding = 10
-            frame_count_box_width = int(
-                config.frame_count_font_size * 4
-            )  # Approximate width
-            frame_count_box_height = int(config.frame_count_font_size * 1.5)
-
-            # Add background box for frame count
-            v = v.filter(
-                "drawbox",
-                x=0,
-                y=0,
-                color=f"black@{config.text_bg_opacity}",
-                width=frame_count_box_width,
-                height=frame_count_box_height,
-                t="fill",
+            # Record this clip's geometry for the shared text layer; its labels
+            # are drawn at x_offset so they land over the right column
+            overlay_clips.append(
+                (video_config, x_offset, frame_width, frame_height, frame_count)
             )
-
-            # Add frame count text
-            frame_count_text = f"Frames: {frame_count}"
-            v = v.filter(
-                "drawtext",
-                text=frame_count_text,
-                fontsize=config.frame_count_font_size,
-                fontcolor=config.text_color,
-                x=frame_count_padding,
-                y=frame_count_padding,
+            x_offset += frame_width
+
+            # Source label: a direct input stream, or this branch's tap off the
+            # shared split when the same trimmed input feeds several branches
+            input_index = video_input_indices[i]
+            if input_index in splits_taken:
+                source_label = f"[src{input_index}_{splits_taken[input_index]}]"
+                splits_taken[input_index] += 1
+            else:
+                source_label = f"[{input_index}:v]"
+
+            # Pin yuv420p as the last step of every branch so all hstack inputs
+            # arrive in the same pixel format and libavfilter doesn't insert
+            # its own scale/format conversion nodes
+            chain.append("format=yuv420p")
+            filter_parts.append(f"{source_label}{','.join(chain)}[v{i}]")
+            video_labels.append(f"[v{i}]")
+
+        # One composite-wide text layer (background boxes, headings, subheadings
+        # and frame counts for every clip) rasterized to a single RGBA PNG and
+        # composited after hstack: one overlay filter and one format conversion
+        # for the whole output instead of one per clip. A static PNG input
+        # repeats its last frame, so it covers the entire duration.
+        # Rasterization only needs the geometry computed above, so it runs in
+        # the background while the audio probing below waits on ffprobe —
+        # wallclock is max(render, probe) instead of their sum. The with
+        # block joins the worker even if the audio section raises.
+        with ThreadPoolExecutor(max_workers=1) as overlay_executor:
+            overlay_future = overlay_executor.submit(
+                render_overlay_png,
+                overlay_clips,
+                x_offset,
+                target_height,
+                config,
+                overlay_dir / "overlay.png",
             )
 
-        processed_streams.append(v)
-
-    # Horizontal stack all videos
-    print(f"  Stacking {len(processed_streams)} videos horizontally...")
-    stacked = ffmpeg.filter(processed_streams, "hstack", inputs=len(processed_streams))
-
-    # Step 3: Choose audio source (prefer explicit audio_path, otherwise first available audio stream)
-    print("\nAdding audio from first available source...")
-
-    audio_input = None
-
-    # Prefer explicit audio_path on the first video config if provided
-    if config.videos:
-        first_vcfg = config.videos[0]
-        explicit_audio = getattr(first_vcfg, "audio_path", None)
-        if explicit_audio:
-            # Accept either Path or str
-            try:
-                explicit_path = str(explicit_audio)
-                if Path(explicit_path).exists():
-                    audio_input = ffmpeg.input(explicit_path).audio
-                    print(f"  Using explicit audio file: {explicit_path}")
-            except Exception:
-                # If explicit audio_path is invalid, fall through to probing inputs
-                audio_input = None
-
-    # If no explicit audio, probe inputs to find first with an audio stream
-    if audio_input is None:
-        for idx, vcfg in enumerate(config.videos):
-            try:
-                probe = ffmpeg.probe(str(vcfg.path))
-                has_audio = any(
-                    s
-                    for s in probe.get("streams", [])
-                    if s.get("codec_type") == "audio"
+            # Step 3: Choose audio source (prefer explicit audio_path, otherwise first available audio stream)
+            print("\nAdding audio from first available source...")
+
+            audio_map = None
+
+            # Prefer explicit audio_path on the first video config if provided
+            if config.videos:
+                first_vcfg = config.videos[0]
+                explicit_audio = getattr(first_vcfg, "audio_path", None)
+                if explicit_audio and Path(str(explicit_audio)).exists():
+                    audio_index = len(inputs)
+                    inputs.append((str(explicit_audio), {}))
+                    audio_map = f"{audio_index}:a"
+                    print(f"  Using explicit audio file: {explicit_audio}")
+
+            # If no explicit audio, probe inputs to find first with an audio stream
+            if audio_map is None:
+                import ffmpeg
+
+                for idx, vcfg in enumerate(config.videos):
+                    try:
+                        probe = ffmpeg.probe(str(vcfg.path))
+                        has_audio = any(
+                            s
+                            for s in probe.get("streams", [])
+                            if s.get("codec_type") == "audio"
+                        )
+                    except (ffmpeg.Error, FileNotFoundError):
+                        has_audio = False
+
+                    if has_audio:
+                        audio_map = f"{video_input_indices[idx]}:a"
+                        print(f"  Using audio from video {idx + 1}: {vcfg.path}")
+                        break
+
+            if audio_map is None:
+                print(
+                    "  No audio stream found in inputs. Output will be generated without audio."
                 )
-            except (ffmpeg.Error, FileNotFoundError):
-                has_audio = False
-
-            if has_audio:
-                audio_input = input_streams[idx].audio
-                print(f"  Using audio from video {idx + 1}: {vcfg.path}")
-                break
-
-    if audio_input is None:
-        print(
-            "  No audio stream found in inputs. Output will be generated without audio."
-        )
-
-    # Step 4: Output with encoding settings
-    print("\nEncoding video with ffmpeg...")
-    print(f"  Preset: {config.output_preset}")
-    print(f"  Threads: {config.output_threads}")
-    print(f"  Bitrate: {config.output_bitrate}")
-    print(f"\nExporting to: {config.output_path}")
-    print("Encoding...\n")
 
-    try:
-        # Build output args/kwargs depending on whether audio is available
-        output_kwargs = {
-            "r": output_fps,
-            "vcodec": "libx264",
-            "preset": config.output_preset,
-            "video_bitrate": config.output_bitrate,
-            "threads": config.output_threads,
-        }
-
-        if audio_input is not None:
-            # Include audio encoding options only when we have an audio stream
-            output_args = (stacked, audio_input, str(config.output_path))
-            output_kwargs.update({"acodec": "aac", "audio_bitrate": "192k"})
+            # Join the text layer and finish the graph: stack all videos, then
+            # composite the overlay on top (if any clip needed one)
+            overlay_path = overlay_future.result()
+        print(f"  Stacking {len(video_labels)} videos horizontally...")
+        if overlay_path:
+            filter_parts.append(
+                f"{''.join(video_labels)}hstack=inputs={len(video_labels)}[stacked]"
+            )
+            overlay_index = len(inputs)
+            inputs.append((str(overlay_path), {}))
+            filter_parts.append(
+                f"[stacked][{overlay_index}:v]overlay=x=0:y=0,format=yuv420p[vout]"
+            )
         else:
-            output_args = (stacked, str(config.output_path))
+            filter_parts.append(
+                f"{''.join(video_labels)}hstack=inputs={len(video_labels)}[vout]"
+            )
+        filter_complex = ";".join(filter_parts)
 
-        output = ffmpeg.output(*output_args, **output_kwargs)
+        # Step 4: Output with encoding settings
+        encoder = _select_h264_encoder()
 
-        # Run with error stats
-        ffmpeg.run(output, overwrite_output=True, quiet=False)
+        print("\nEncoding video with ffmpeg...")
+        print(f"  Encoder: {encoder}")
+        print(f"  Preset: {config.output_preset}")
+        print(f"  Threads: {config.output_threads}")
+        print(f"  Bitrate: {config.output_bitrate}")
+        print(f"\nExporting to: {config.output_path}")
+        print("Encoding...\n")
 
-        print(f"\n✓ Video composite saved to: {config.output_path}")
-        if audio_input is not None:
-            print("✓ Audio included")
-        else:
-            print("✓ No audio included")
-        print("\n✓ Done!")
+        cmd = compile_command(
+            inputs, filter_complex, audio_map, output_fps, encoder, config
+        )
 
-    except ffmpeg.Error as e:
-        print("\n✗ FFmpeg encoding failed:")
-        if e.stderr:
-            print(e.stderr.decode())
-        elif e.stdout:
-            print(e.stdout.decode())
-        else:
-            print(str(e))
-        raise
-    except FileNotFoundError:
-        print("\n✗ Error: ffmpeg not found")
-        print("Please install ffmpeg: https://ffmpeg.org/download.html")
-        sys.exit(1)
+        try:
+            # ffmpeg inherits stdout/stderr, so its progress output reaches the
+            # terminal directly with no Python read loop in between
+            result = subprocess.run(cmd)
+            if result.returncode != 0:
+                print("\n✗ FFmpeg encoding failed (see output above)")
+                raise RuntimeError(f"ffmpeg exited with code {result.returncode}")
+
+            print(f"\n✓ Video composite saved to: {config.output_path}")
+            for variant in getattr(config, "output_variants", None) or []:
+                print(f"✓ Variant saved to: {variant['path']}")
+            if audio_map is not None:
+                print("✓ Audio included")
+            else:
+                print("✓ No audio included")
+            print("\n✓ Done!")
+
+        except FileNotFoundError:
+            print("\n✗ Error: ffmpeg not found")
+            print("Please install ffmpeg: https://ffmpeg.org/download.html")
+            sys.exit(1)
+    finally:
+        # Temp overlay PNGs are only needed while ffmpeg runs
+        shutil.rmtree(overlay_dir, ignore_errors=True)
 
 
 def main():
+    from config_parser import create_example_config, load_config
+
     print("=" * 70)
     print("FFmpeg Video Composite Script (Ultra-Fast)")
     print("=" * 70)